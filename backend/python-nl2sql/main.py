@@ -1,23 +1,26 @@
-import datetime
 from fastapi import FastAPI, UploadFile, File as FastAPIFile, APIRouter, Depends, HTTPException, Form
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import uuid
 import tempfile
+from operator import attrgetter
 import os
-import json
+import orjson
 import asyncio
 import pandas as pd
-from typing import AsyncGenerator, Optional
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, BinaryIO, Optional
 from models.database import get_main_db, file_storage_engine
 from models.file import File
-from services.file_service import get_column_metadata, generate_table_schema, create_table_sql, insert_values, clean_table_name, save_table_metadata
+from models.column_metadata import ColumnMetadata
+from utils.db_utils import UUID_RE
+from services.file_service import get_column_metadata, generate_table_schema, create_table_sql, insert_values, clean_table_name, save_table_metadata, read_upload_file, UPLOAD_PARSERS
 
 
-app = FastAPI(title="Chat File Upload API")
+app = FastAPI(title="Chat File Upload API", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -48,41 +51,119 @@ class AskRequest(BaseModel):
 chat_router = APIRouter(prefix="/chats", tags=["chats"])
 
 
+# Latest progress per upload task, and an event per task that is set whenever it changes
 progress_store = {}
+progress_events: dict[str, asyncio.Event] = {}
 
+# Seconds a finished task's final status stays readable for late SSE readers before it is dropped
+PROGRESS_RETENTION_SECONDS = 60
+
+# ColumnMetadata attributes returned by the upload endpoint, read in one C-level call per row
+COLUMN_METADATA_FIELDS = (
+    "id", "file_id", "column_name", "data_type", "sql_type", "nullable", "is_category",
+    "is_boolean", "is_date", "unique_count", "null_count", "min_value", "max_value",
+    "mean_value", "median_value", "std_value", "sample_values", "top_values", "enum_values",
+    "value_mappings", "synonym_mappings", "example_queries", "description",
+)
+column_metadata_values = attrgetter(*COLUMN_METADATA_FIELDS)
+
+# Worker threads for blocking upload work (parsing, schema generation, bulk load).
+# Threads rather than processes: the parsed DataFrame is needed back in the request,
+# and the PyArrow CSV reader and the psycopg2 COPY both release the GIL.
+upload_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="upload")
+
+
+def parse_and_load(source: BinaryIO, filename: str, table_name: str) -> tuple[pd.DataFrame, str]:
+    """Parse an uploaded file, create its table and bulk-load the rows (blocking)"""
+    df = read_upload_file(source, filename)
+
+    # Generate SQL schema
+    sql_schema = generate_table_schema(df, table_name)
+
+    # Create the table and load it on one connection, in one transaction
+    with file_storage_engine.begin() as conn:
+        create_table_sql(sql_schema, table_name, conn)
+        insert_values(df, table_name, conn)
+
+    return df, sql_schema
+
+
+def save_upload_records(db: Session, df: pd.DataFrame, chat_id: str, user_id: str,
+                        filename: str, table_name: str) -> tuple[uuid.UUID, list[ColumnMetadata]]:
+    """Create the file record, then generate and persist its column metadata (blocking)"""
+    # Create file record in main database; RETURNING hands back the server-generated id
+    # in the same round-trip instead of a refresh SELECT
+    file_id = db.execute(
+        insert(File)
+        .values(chat_id=uuid.UUID(chat_id), user_id=uuid.UUID(user_id), filename=filename, table_name=table_name)
+        .returning(File.id)
+    ).scalar_one()
+
+    # Generate column metadata and persist (commits the file record along with it)
+    metadata = get_column_metadata(df, file_id)
+    save_table_metadata(metadata, db)
+
+    return file_id, metadata
+
+
+
+def publish_progress(task_id: Optional[str], status: str, progress: int, message: str):
+    """Record the latest progress for an upload task and wake any SSE readers"""
+    if task_id is None:
+        return
+    progress_data = {"status": status, "progress": progress, "message": message}
+    progress_store[task_id] = progress_data
+    progress_events.setdefault(task_id, asyncio.Event()).set()
+
+    # Task IDs come from clients, so entries must not outlive the upload whether or not anyone reads them
+    if status in ("completed", "error"):
+        asyncio.get_running_loop().call_later(
+            PROGRESS_RETENTION_SECONDS, discard_progress, task_id, progress_data
+        )
+
+
+def discard_progress(task_id: str, progress_data: dict):
+    """Drop a finished task's progress, unless a newer upload has reused the task ID since"""
+    if progress_store.get(task_id) is progress_data:
+        del progress_store[task_id]
+        progress_events.pop(task_id, None)
 
 
 async def generate_progress_updates(task_id: str) -> AsyncGenerator[str, None]:
     """Generate SSE updates for file upload progress"""
-    # Wait for task to be created
-    wait_count = 0
-    while task_id not in progress_store and wait_count < 100:
-        await asyncio.sleep(0.1)
-        wait_count += 1
-    
-    if task_id not in progress_store:
-        yield f"data: {json.dumps({'status': 'error', 'message': 'Task not found', 'progress': 0})}\n\n"
-        return
-    
-    last_data = None
-    while True:
-        if task_id in progress_store:
-            progress_data = progress_store[task_id]
-            
-            # Only send if data has changed
-            if progress_data != last_data:
-                data = json.dumps(progress_data)
-                yield f"data: {data}\n\n"
-                last_data = progress_data.copy()
-            
-            # If completed or error, clean up and exit
-            if progress_data.get("status") in ["completed", "error"]:
-                await asyncio.sleep(1)
-                if task_id in progress_store:
-                    del progress_store[task_id]
-                break
-        
-        await asyncio.sleep(0.1)
+    event = progress_events.setdefault(task_id, asyncio.Event())
+    last_sent = None
+    try:
+        while True:
+            progress_data = progress_store.get(task_id)
+            if progress_data is None and last_sent is not None:
+                break  # expired after the task finished
+
+            if progress_data is not None and progress_data is not last_sent:
+                last_sent = progress_data
+                yield f"data: {orjson.dumps(progress_data).decode()}\n\n"
+
+                # If completed or error, stop streaming
+                if progress_data.get("status") in ["completed", "error"]:
+                    break
+                continue
+
+            # Nothing new since our last frame. Several readers can share the event, so each one
+            # compares against what it sent itself; clearing right before waiting loses no update.
+            event.clear()
+            if last_sent is None:
+                # Wait for the task's first update instead of polling for it
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    yield f"data: {orjson.dumps({'status': 'error', 'message': 'Task not found', 'progress': 0}).decode()}\n\n"
+                    return
+            else:
+                await event.wait()
+    finally:
+        # Published tasks are cleaned up by publish_progress; only drop events for unknown IDs
+        if task_id not in progress_store:
+            progress_events.pop(task_id, None)
 
 @chat_router.get("/{chat_id}/files/upload/progress/{task_id}")
 async def get_upload_progress(task_id: str):
@@ -103,121 +184,62 @@ async def upload_file(
     chat_id: str,
     file: UploadFile = FastAPIFile(...),
     user_id: str = Form(...), 
+    task_id: Optional[str] = Form(None),
     db: Session = Depends(get_main_db)
 ):
     """Upload file and return metadata immediately"""
     try:
         # Validate chat_id and user_id as UUID
-        try:
-            chat_id_uuid = uuid.UUID(chat_id)
-            user_id_uuid = uuid.UUID(user_id)
-        except ValueError:
+        if not (UUID_RE.fullmatch(chat_id) and UUID_RE.fullmatch(user_id)):
             raise HTTPException(status_code=400, detail="Invalid chat ID or user ID")
 
         # Validate file extension
-        if not file.filename.lower().endswith(('.csv', '.xlsx', '.xls')):
+        if os.path.splitext(file.filename)[1].lower() not in UPLOAD_PARSERS:
             raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
 
-        # Read file content
-        file_content = await file.read()
         filename = file.filename
 
-        # Create a project-local tmp directory and write the file there
-        base_dir = Path(__file__).resolve().parent
-        tmp_dir = base_dir / "tmp_uploads"
-        tmp_dir.mkdir(parents=True, exist_ok=True)
-        temp_path = tmp_dir / f"{uuid.uuid4()}_{filename}"
-        
-        try:
-            with open(temp_path, "wb") as f:
-                f.write(file_content)
-
-            # Read the file into DataFrame
-            if filename.lower().endswith('.csv'):
-                df = pd.read_csv(temp_path)
-            else:  # Excel files
-                df = pd.read_excel(temp_path)
-
-            # Generate unique table name
-            raw_table_name = f"{chat_id}_{filename}"
-            table_name = clean_table_name(raw_table_name)
-            
-            # Generate SQL schema
-            sql_schema = generate_table_schema(df, table_name)
+        loop = asyncio.get_running_loop()
 
-            
-            # Create table in file storage database
-            create_table_sql(sql_schema, table_name, file_storage_engine)
+        publish_progress(task_id, "processing", 10, "Parsing file")
 
-            
-            # Insert data
-            insert_values(df, table_name, file_storage_engine)
+        # Generate unique table name
+        raw_table_name = f"{chat_id}_{filename}"
+        table_name = clean_table_name(raw_table_name)
+
+        # Parse the upload straight from its spooled file (in memory for small uploads,
+        # spilled to disk by Starlette for large ones) and load it off the event loop
+        df, sql_schema = await loop.run_in_executor(
+            upload_executor, parse_and_load, file.file, filename, table_name
+        )
+
+        publish_progress(task_id, "processing", 60, "Saving column metadata")
+
+        # Record the file and its column metadata in the main database, also off the event loop
+        file_id, metadata = await loop.run_in_executor(
+            upload_executor, save_upload_records, db, df, chat_id, user_id, filename, table_name
+        )
+
+        # Serialize metadata to dicts; every row shares the file ID, so stringify it once
+        file_id = str(file_id)
+        columns_metadata = [
+            {**dict(zip(COLUMN_METADATA_FIELDS, column_metadata_values(m))), "file_id": file_id}
+            for m in metadata
+        ]
+
+        publish_progress(task_id, "completed", 100, "File processed")
+
+        # Return the required JSON response
+        return {
+            "file_id": file_id,
+            "filename": filename,
+            "table_name": table_name,
+            "sql_schema": sql_schema,
+            "columns_metadata": columns_metadata,
+        }
 
-            
-            # Create file record in main database
-            file_record = File(
-                chat_id=chat_id_uuid,
-                user_id=user_id_uuid,
-                filename=filename,
-                table_name=table_name,
-                created_at=datetime.datetime.now(datetime.timezone.utc)
-            )
-
-            db.add(file_record)
-            db.commit()
-            db.refresh(file_record)
-            
-            # Generate column metadata and persist
-            metadata = get_column_metadata(df, file_record.id)
-            save_table_metadata(metadata, db)
-
-            # Serialize metadata to JSON-friendly dicts
-            columns_metadata = [
-                {
-                    "id": str(m.id) if getattr(m, "id", None) is not None else None,
-                    "file_id": str(m.file_id) if getattr(m, "file_id", None) is not None else None,
-                    "column_name": m.column_name,
-                    "data_type": m.data_type,
-                    "sql_type": m.sql_type,
-                    "nullable": m.nullable,
-                    "is_category": m.is_category,
-                    "is_boolean": m.is_boolean,
-                    "is_date": m.is_date,
-                    "unique_count": m.unique_count,
-                    "null_count": m.null_count,
-                    "min_value": m.min_value,
-                    "max_value": m.max_value,
-                    "mean_value": m.mean_value,
-                    "median_value": m.median_value,
-                    "std_value": m.std_value,
-                    "sample_values": m.sample_values,
-                    "top_values": m.top_values,
-                    "enum_values": m.enum_values,
-                    "value_mappings": m.value_mappings,
-                    "synonym_mappings": m.synonym_mappings,
-                    "example_queries": m.example_queries,
-                    "description": m.description,
-                }
-                for m in metadata
-            ]
-
-            # Return the required JSON response
-            return {
-                "file_id": str(file_record.id),
-                "filename": filename,
-                "table_name": table_name,
-                "sql_schema": sql_schema,
-                "columns_metadata": columns_metadata,
-            }
-            
-        finally:
-            try:
-                if temp_path.exists():
-                    temp_path.unlink()
-            except Exception:
-                pass
-                
     except Exception as e:
+        publish_progress(task_id, "error", 0, str(e))
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
             
 app.include_router(chat_router)
@@ -225,4 +247,16 @@ app.include_router(chat_router)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="localhost", port=8000, reload=True)
\ No newline at end of file
+    # Reload is for development only (set DEV=1); it needs the app as an import string.
+    # "auto" picks uvloop and httptools when installed (not on Windows) and falls back to asyncio/h11.
+    # Keep WORKERS at 1 unless upload progress moves out of process memory.
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "localhost"),
+        port=int(os.getenv("PORT", "8000")),
+        reload=os.getenv("DEV") == "1",
+        workers=int(os.getenv("WORKERS", "1")),
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=30
+    )
\ No newline at end of file
@@ -1,16 +1,13 @@
 from langchain.prompts import PromptTemplate
 
 # Template for SQLCoder model
+# Static instructions come first so the inference server can reuse its cached prompt
+# prefix across requests; per-table metadata and the user question are appended last.
 SQLCODER_PROMPT = PromptTemplate(
     input_variables=["table_name", "columns", "user_query"],
     template=(
         "You are an expert PostgreSQL analyst and SQL query generator.\n"
         "Use the provided table metadata to compose a single, correct SQL query that answers the user's question.\n\n"
-        "### Table Name\n"
-        "{table_name}\n\n"
-        "### Columns and Metadata\n"
-        "(Use names exactly as given; they are already cleaned for PostgreSQL)\n"
-        "{columns}\n\n"
         "### Rules\n"
         "- Output only SQL (no explanation or markdown).\n"
         "- Use standard PostgreSQL syntax.\n"
@@ -20,8 +17,21 @@ SQLCODER_PROMPT = PromptTemplate(
         "- Use LIMIT when returning raw rows (defaults to 50 if not specified by the question).\n"
         "- Use value_mappings and synonym_mappings to interpret category codes or alternate phrasings if applicable.\n"
         "- Quote identifiers with double quotes if needed.\n\n"
+        "### Table Name\n"
+        "{table_name}\n\n"
+        "### Columns and Metadata\n"
+        "(Use names exactly as given; they are already cleaned for PostgreSQL)\n"
+        "{columns}\n\n"
         "### User Question\n"
         "{user_query}\n\n"
         "### SQL Query:"
     ),
-)
\ No newline at end of file
+)
+
+# Bound str.format_map of the template, resolved once at import time
+_render_sqlcoder = SQLCODER_PROMPT.template.format_map
+
+
+def render_sqlcoder_prompt(variables: dict) -> str:
+    """Render SQLCODER_PROMPT directly, skipping PromptTemplate's per-call validation"""
+    return _render_sqlcoder(variables)
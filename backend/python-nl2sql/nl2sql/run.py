@@ -1,5 +1,4 @@
 from sqlcoder_chain import NL2SQLGenerator
-from nl2sql.sqlcoder_chain import NL2SQLGenerator
 import asyncio
 
 async def test():
@@ -556,6 +555,7 @@ async def test():
     )
     print("Generated SQL:\n", query2)
 
-asyncio.run(test())
+if __name__ == "__main__":
+    asyncio.run(test())
 
 
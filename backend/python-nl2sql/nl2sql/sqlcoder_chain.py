@@ -1,20 +1,95 @@
 from langchain_ollama import ChatOllama
 from langchain_core.output_parsers import StrOutputParser
-from prompt_template import SQLCODER_PROMPT
-import json
+from langchain_core.runnables import RunnableLambda
+from prompt_template import render_sqlcoder_prompt
+from collections import OrderedDict
+import functools
+import hashlib
+import re
+import orjson
+from typing import AsyncIterator
+
+# Contents of the first markdown code fence (```sql or bare ```), up to its closing fence or the end
+SQL_FENCE_RE = re.compile(r'```[ \t]*(?:sql)?[ \t]*\n?(.*?)(?:```|\Z)', re.IGNORECASE | re.DOTALL)
+
+# A line opening with an upper-case statement keyword. Case-sensitive on purpose: prose such as
+# "With the given metadata..." or "Select the rows..." must not be taken for SQL.
+SQL_START_RE = re.compile(r'^[ \t]*(?=(?:SELECT|WITH|INSERT|UPDATE|DELETE|CREATE)\b)', re.MULTILINE)
+
+# Fallback for completions that are nothing but lower-case SQL (prose sentences start capitalised)
+SQL_ONLY_RE = re.compile(r'\s*(?=(?:select|with|insert|update|delete|create)\b)')
+
+
+def first_statement(sql: str) -> str:
+    """Cut SQL text after its first ';' that is not inside a quoted literal or identifier"""
+    quote = None
+    for i, char in enumerate(sql):
+        if quote:
+            if char == quote:
+                quote = None  # a doubled '' or "" escape simply re-opens on the next char
+        elif char in ("'", '"'):
+            quote = char
+        elif char == ";":
+            return sql[:i + 1]
+    return sql.strip()
+
+
+def extract_sql(completion: str) -> str | None:
+    """
+    Pull the first SQL statement out of a raw model completion, or return None if there is none.
+    A fenced code block wins; otherwise the statement starts at the first line opening with an
+    upper-case keyword, or at the start of a completion that is only SQL. Applying it to its own
+    output returns the same string.
+    """
+    fence = SQL_FENCE_RE.search(completion)
+    if fence and fence.group(1).strip():
+        return first_statement(fence.group(1).strip())
+
+    start = SQL_START_RE.search(completion) or SQL_ONLY_RE.match(completion)
+    if start:
+        return first_statement(completion[start.end():].strip())
+    return None
+
+
+# Maximum number of generated SQL strings kept in the exact-match cache
+SQL_CACHE_SIZE = 256
+
+# Maximum number of formatted column-metadata blocks kept per process
+METADATA_CACHE_SIZE = 128
+
+
+@functools.lru_cache(maxsize=8)
+def get_llm(model_name: str) -> ChatOllama:
+    """
+    Return a shared ChatOllama client per model so generators reuse the same HTTP
+    connection, and ask Ollama to keep the model loaded between requests.
+    """
+    return ChatOllama(
+        model=model_name,
+        temperature=0.0,
+        top_p=0.9,
+        num_predict=512,
+        keep_alive="30m"
+    )
+
+
+# (extracted SQL, raw completion) keyed by a hash of everything that goes into the prompt.
+# Cache reads and writes never await, so they are atomic on the event loop and need no lock.
+_sql_cache: OrderedDict[str, tuple[str, str]] = OrderedDict()
+
+# Formatted metadata text keyed by a digest of the metadata itself, so repeated questions
+# against the same table skip rebuilding the columns block.
+_metadata_text_cache: OrderedDict[bytes, str] = OrderedDict()
+
 
 class NL2SQLGenerator:
     def __init__(self, model_name: str = "sqlcoder:7b"):
         """
         Initialize SQLCoder model via Ollama backend.
         """
-        self.llm = ChatOllama(
-            model=model_name,
-            temperature=0.0,
-            top_p=0.9,
-            num_predict=512
-        )
-        self.chain = SQLCODER_PROMPT | self.llm | StrOutputParser()
+        self.model_name = model_name
+        self.llm = get_llm(model_name)
+        self.chain = RunnableLambda(render_sqlcoder_prompt) | self.llm | StrOutputParser()
 
     def format_metadata(self, columns_metadata: list[dict]) -> str:
         """
@@ -22,11 +97,29 @@ class NL2SQLGenerator:
         Each column entry includes: name, data_type, sql_type, nullability, enums/top values,
         mappings, synonyms, and a short description.
         """
+        cache_key = hashlib.blake2b(
+            orjson.dumps(columns_metadata, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+        ).digest()
+
+        cached = _metadata_text_cache.get(cache_key)
+        if cached is not None:
+            _metadata_text_cache.move_to_end(cache_key)
+            return cached
+
         def short_list(values, max_items=5):
             if not values:
                 return []
             return values[:max_items]
 
+        def join_values(values):
+            # Plain comma-separated values tokenize far smaller than Python list/dict reprs
+            return ", ".join(map(str, values))
+
+        def format_top_value(item):
+            if isinstance(item, dict):
+                return f"{item.get('value')} ({item.get('count')})"
+            return str(item)
+
         lines = []
         for col in columns_metadata:
             name = col.get("column_name")
@@ -37,46 +130,113 @@ class NL2SQLGenerator:
             is_bool = col.get("is_boolean")
             is_date = col.get("is_date")
             enum_values = short_list(col.get("enum_values") or [])
-            top_values = short_list(col.get("top_values") or [])
-            sample_values = short_list(col.get("sample_values") or [])
+            # Frequency lists only help for categorical/boolean columns
+            top_values = short_list(col.get("top_values") or []) if is_cat or is_bool else []
+            sample_values = short_list(col.get("sample_values") or [], max_items=3 if dtype == "TEXT" else 5)
             value_mappings = col.get("value_mappings") or {}
             synonym_mappings = col.get("synonym_mappings") or {}
             description = col.get("description", "")
 
-            parts = [
-                f"- {name} [{dtype} -> {sql_type}]",
-                f"  nullable: {nullable}, category: {is_cat}, boolean: {is_bool}, date: {is_date}",
-            ]
+            # Append every line to one flat list so the block is joined exactly once
+            lines.append(f"- {name} [{dtype} -> {sql_type}]")
+            lines.append(f"  nullable: {nullable}, category: {is_cat}, boolean: {is_bool}, date: {is_date}")
 
             if enum_values:
-                parts.append(f"  enum_values: {enum_values}")
+                lines.append(f"  enum_values: {join_values(enum_values)}")
             if top_values:
-                parts.append(f"  top_values: {top_values}")
+                lines.append(f"  top_values: {', '.join(map(format_top_value, top_values))}")
             if sample_values:
-                parts.append(f"  sample: {sample_values}")
+                lines.append(f"  sample: {join_values(sample_values)}")
             if value_mappings:
-                parts.append(f"  value_mappings: {value_mappings}")
+                lines.append(f"  value_mappings: {', '.join(f'{k}={v}' for k, v in value_mappings.items())}")
             if synonym_mappings:
                 # Only include synonyms relevant to this column
                 syns = synonym_mappings.get(name) if isinstance(synonym_mappings, dict) else None
                 if syns:
-                    parts.append(f"  synonym_mappings: {syns}")
+                    lines.append(f"  synonym_mappings: {join_values(syns)}")
             if description:
-                parts.append(f"  description: {description}")
+                lines.append(f"  description: {description}")
 
-            lines.append("\n".join(parts))
+        text = "\n".join(lines)
+        _metadata_text_cache[cache_key] = text
+        if len(_metadata_text_cache) > METADATA_CACHE_SIZE:
+            _metadata_text_cache.popitem(last=False)
 
-        return "\n".join(lines)
+        return text
+
+    def _prepare(self, table_name: str, metadata: list[dict], user_query: str) -> tuple[str, dict]:
+        """Validate the question and build the SQL cache key and prompt variables"""
+        # Collapse runs of whitespace so trivially reformatted repeats share a cache entry
+        user_query = " ".join(user_query.split())
+        if not user_query:
+            raise ValueError("user_query must not be empty")
 
-    async def generate_sql(self, table_name: str, metadata: list[dict], user_query: str) -> str:
-        """
-        Given user query + metadata, return generated SQL string.
-        """
         columns_text = self.format_metadata(metadata)
-        result = await self.chain.ainvoke({
+        cache_key = hashlib.blake2b(
+            f"{self.model_name}|{table_name}|{columns_text}|{user_query}".encode()
+        ).hexdigest()
+
+        variables = {
             "table_name": table_name,
             "columns": columns_text,
             "user_query": user_query
-        })
+        }
+        return cache_key, variables
+
+    @staticmethod
+    def _store(cache_key: str, result: str) -> str:
+        """Clean a raw completion and remember it in the SQL cache"""
+        # Models sometimes wrap the query in a markdown fence or add prose despite the prompt rules
+        sql = extract_sql(result)
+        if sql is None:
+            # Nothing recognisable as SQL: hand back the raw text, but never cache it
+            return result.strip()
+
+        _sql_cache[cache_key] = (sql, result)
+        if len(_sql_cache) > SQL_CACHE_SIZE:
+            _sql_cache.popitem(last=False)
+
+        return sql
+
+    async def generate_sql(self, table_name: str, metadata: list[dict], user_query: str) -> str:
+        """
+        Given user query + metadata, return generated SQL string.
+        Identical (model, table, metadata, question) requests are served from an LRU cache
+        instead of calling the model again.
+        """
+        cache_key, variables = self._prepare(table_name, metadata, user_query)
+
+        cached = _sql_cache.get(cache_key)
+        if cached is not None:
+            _sql_cache.move_to_end(cache_key)
+            return cached[0]
+
+        result = await self.chain.ainvoke(variables)
+
+        if not isinstance(result, str):
+            raise TypeError(f"Expected the SQL chain to return str, got {type(result).__name__}")
+
+        return self._store(cache_key, result)
+
+    async def stream_sql(self, table_name: str, metadata: list[dict], user_query: str) -> AsyncIterator[str]:
+        """
+        Same as generate_sql, but yield the completion token by token as Ollama decodes it
+        so callers can forward the first tokens immediately (e.g. as an NDJSON stream).
+        Chunks are always the raw model output (prose and markdown fences included), also
+        when the completion is replayed from the cache; join them and pass the text to
+        extract_sql for the query generate_sql would return.
+        """
+        cache_key, variables = self._prepare(table_name, metadata, user_query)
+
+        cached = _sql_cache.get(cache_key)
+        if cached is not None:
+            _sql_cache.move_to_end(cache_key)
+            yield cached[1]
+            return
+
+        parts = []
+        async for chunk in self.chain.astream(variables):
+            parts.append(chunk)
+            yield chunk
 
-        return result
\ No newline at end of file
+        self._store(cache_key, "".join(parts))
@@ -1,13 +1,143 @@
+import os
 import re
+import functools
+import io
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 from uuid import uuid4
 import sqlalchemy
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, insert, text
 from models.column_metadata import ColumnMetadata
+from utils.db_utils import validate_table_name, psql_insert_copy
 from sqlalchemy.orm import Session
 
 
+# Rows appended per batch when loading a DataFrame into the file storage database
+INSERT_CHUNK_ROWS = 100_000
+
+# Column-name keywords -> synonyms for query understanding (first match wins).
+# Matching columns share these tuples instead of each getting a fresh list.
+SYNONYM_RULES = (
+    (('age', 'year', 'born'), ("age", "years old", "birth year", "born in")),
+    (('name', 'title', 'label'), ("name", "title", "called", "named")),
+    (('gender', 'sex'), ("gender", "sex", "male or female")),
+    (('score', 'grade', 'mark', 'point'), ("score", "grade", "marks", "points", "rating")),
+    (('country', 'nation', 'location'), ("country", "nation", "location", "from")),
+)
+
+# Bytes of CSV handed to each PyArrow parse block; larger blocks mean fewer, bigger
+# batches for the reader threads on multi-megabyte uploads
+CSV_BLOCK_SIZE = 8 << 20
+
+# Characters replaced with '_' when turning column/file names into identifiers
+NON_IDENTIFIER_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# Upload extensions stripped from table names
+FILE_EXTENSION_RE = re.compile(r'\.(csv|xlsx?|json|txt)$', re.IGNORECASE)
+
+# pandas dtype kind -> PostgreSQL type for columns whose type does not depend on the data
+FIXED_SQL_TYPES = {
+    'f': "DOUBLE PRECISION",
+    'b': "BOOLEAN",
+    'M': "TIMESTAMP",
+}
+
+
+def pandas_column_names(header) -> list[str]:
+    """Name columns the same way pandas' readers do (blank -> "Unnamed: i", duplicates -> "name.1")"""
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None or name == "" else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def read_csv(source) -> pd.DataFrame:
+    """
+    Read a CSV file with PyArrow's multi-threaded reader.
+    Columns are parsed straight into Arrow buffers and converted to pandas once,
+    with the same column types pd.read_csv would produce.
+    """
+    read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+    convert_options = pacsv.ConvertOptions(strings_can_be_null=True)
+
+    def parse(text_columns):
+        # pd.read_csv keeps dates, times and timestamps as the text in the file, while Arrow
+        # parses and reformats them (e.g. "10:30" -> "10:30:00"); read those columns as plain
+        # strings. Columns are addressed by position so duplicate header names stay distinct.
+        if hasattr(source, "seek"):
+            source.seek(0)  # open_csv below has already consumed the first block
+        if not text_columns:
+            return pacsv.read_csv(source, read_options=read_options, convert_options=convert_options)
+        return pacsv.read_csv(
+            source,
+            read_options=pacsv.ReadOptions(
+                block_size=CSV_BLOCK_SIZE,
+                column_names=[str(i) for i in range(len(header))],
+                skip_rows=1
+            ),
+            convert_options=pacsv.ConvertOptions(
+                strings_can_be_null=True,
+                column_types={str(i): pa.string() for i in text_columns}
+            )
+        )
+
+    # Infer the schema from the first block only, so the file is fully parsed once
+    with pacsv.open_csv(source, read_options=read_options, convert_options=convert_options) as reader:
+        schema = reader.schema
+    header = schema.names
+    temporal = [i for i, field in enumerate(schema) if pa.types.is_temporal(field.type)]
+    table = parse(temporal)
+
+    # A column that was empty throughout the first block can still turn out temporal later on
+    late_temporal = [i for i, field in enumerate(table.schema) if pa.types.is_temporal(field.type)]
+    if late_temporal:
+        table = parse(temporal + late_temporal)
+
+    # Arrow types all-empty columns as null; pandas reads them as float NaN (object if there are no rows)
+    empty_type = pa.float64() if table.num_rows else pa.string()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(empty_type))
+
+    df = table.to_pandas()
+    df.columns = pandas_column_names(header)
+    return df
+
+
+def read_excel(source) -> pd.DataFrame:
+    """
+    Read the first worksheet of an .xlsx/.xls file with calamine's native parser.
+    pandas' calamine engine keeps the column types and blank handling of the openpyxl
+    reader (e.g. empty columns as float NaN) while skipping openpyxl's XML tree.
+    """
+    return pd.read_excel(source, engine="calamine")
+
+
+# File extension -> reader for supported uploads
+UPLOAD_PARSERS = {
+    '.csv': read_csv,
+    '.xlsx': read_excel,
+    '.xls': read_excel,
+}
+
+
+def read_upload_file(source, filename: str) -> pd.DataFrame:
+    """Read an uploaded CSV/Excel file (path or in-memory file object) into a DataFrame based on its extension"""
+    parser = UPLOAD_PARSERS.get(os.path.splitext(filename)[1].lower())
+    if parser is None:
+        raise ValueError(f"Unsupported file type: {filename}")
+    return parser(source)
+
 
 def infer_sql_type(dtype):
     if pd.api.types.is_integer_dtype(dtype):
@@ -21,6 +151,20 @@ def infer_sql_type(dtype):
     else:
         return 'VARCHAR'
 
+def convert_numpy_types(value):
+    """Convert numpy types to native Python types for JSON serialization"""
+    if hasattr(value, 'item'):
+        return value.item()
+    elif isinstance(value, np.integer):
+        return int(value)
+    elif isinstance(value, np.floating):
+        return float(value)
+    elif isinstance(value, np.bool_):
+        return bool(value)
+    else:
+        return value
+
+
 def get_column_metadata(df: pd.DataFrame, file_id):
     metadata = []
     for col in df.columns:
@@ -34,41 +178,39 @@ def get_column_metadata(df: pd.DataFrame, file_id):
             'TEXT'
         )
         sql_type = infer_sql_type(col_dtype)
-        nullable = bool(data.isnull().any())
-        unique_count = int(data.nunique(dropna=True))
-        null_count = int(data.isnull().sum())
-        is_category = str(col_dtype) == "category" or (unique_count <= 20 and data_type != 'BOOLEAN' and data_type != 'DATE')
+        # One null scan; nullability follows from the count
+        null_count = int(data.isna().sum())
+        nullable = null_count > 0
         is_boolean = data_type == 'BOOLEAN'
         is_date = data_type == 'DATE'
 
-        # Numeric stats
-        num_stats = data.dropna() if data_type in ['INTEGER', 'FLOAT'] else None
-        min_value = float(num_stats.min()) if num_stats is not None and not num_stats.empty else None
-        max_value = float(num_stats.max()) if num_stats is not None and not num_stats.empty else None
-        mean_value = float(num_stats.mean()) if num_stats is not None and not num_stats.empty else None
-        median_value = float(num_stats.median()) if num_stats is not None and not num_stats.empty else None
-        std_value = float(num_stats.std()) if num_stats is not None and not num_stats.empty else None
+        # Drop nulls once; samples, frequencies, enums and numeric stats all use the same view
+        non_null = data.dropna()
+        # Distinct values, found once for both the unique count and the enum list
+        uniques = non_null.unique()
+        unique_count = len(uniques)
+        is_category = str(col_dtype) == "category" or (unique_count <= 20 and data_type != 'BOOLEAN' and data_type != 'DATE')
 
-        # JSONB-like fields - convert numpy types to native Python types
-        def convert_numpy_types(value):
-            """Convert numpy types to native Python types for JSON serialization"""
-            if hasattr(value, 'item'):
-                return value.item()
-            elif isinstance(value, np.integer):
-                return int(value)
-            elif isinstance(value, np.floating):
-                return float(value)
-            elif isinstance(value, np.bool_):
-                return bool(value)
-            else:
-                return value
+        # Numeric stats, computed with NumPy reductions over one float64 buffer instead of
+        # going through pandas' per-call dispatch for each statistic
+        min_value = max_value = mean_value = median_value = std_value = None
+        if data_type in ['INTEGER', 'FLOAT'] and not non_null.empty:
+            values = non_null.to_numpy(dtype=np.float64)
+            min_value = float(values.min())
+            max_value = float(values.max())
+            mean_value = float(values.mean())
+            median_value = float(np.median(values))
+            # Sample std is undefined (NaN) for a single value, and NaN is not valid JSON
+            std_value = float(values.std(ddof=1)) if len(values) > 1 else None
 
-        sample_values = [convert_numpy_types(item) for item in data.dropna().sample(min(5, len(data.dropna())), random_state=1).tolist()] if not data.dropna().empty else []
+        # JSONB-like fields - convert numpy types to native Python types
+        sample_values = [convert_numpy_types(item) for item in non_null.sample(min(5, len(non_null)), random_state=1).tolist()] if not non_null.empty else []
         top_values = (
-            [{'value': convert_numpy_types(k), 'count': int(v)} for k, v in data.value_counts(dropna=True).head(5).items()]
-            if not data.dropna().empty else []
+            [{'value': convert_numpy_types(k), 'count': int(v)} for k, v in non_null.value_counts().head(5).items()]
+            if not non_null.empty else []
         )
-        enum_values = [convert_numpy_types(item) for item in data.unique().tolist()] if is_category else None
+        # Nulls are reported via null_count; a NaN entry would also make the JSONB insert fail
+        enum_values = [convert_numpy_types(item) for item in uniques.tolist()] if is_category else None
         
         # Generate intelligent value mappings for categorical data
         value_mappings = {}
@@ -88,16 +230,10 @@ def get_column_metadata(df: pd.DataFrame, file_id):
         # Generate synonym mappings for better query understanding
         synonym_mappings = {}
         col_lower = col.lower()
-        if any(keyword in col_lower for keyword in ['age', 'year', 'born']):
-            synonym_mappings[col] = ["age", "years old", "birth year", "born in"]
-        elif any(keyword in col_lower for keyword in ['name', 'title', 'label']):
-            synonym_mappings[col] = ["name", "title", "called", "named"]
-        elif any(keyword in col_lower for keyword in ['gender', 'sex']):
-            synonym_mappings[col] = ["gender", "sex", "male or female"]
-        elif any(keyword in col_lower for keyword in ['score', 'grade', 'mark', 'point']):
-            synonym_mappings[col] = ["score", "grade", "marks", "points", "rating"]
-        elif any(keyword in col_lower for keyword in ['country', 'nation', 'location']):
-            synonym_mappings[col] = ["country", "nation", "location", "from"]
+        for keywords, synonyms in SYNONYM_RULES:
+            if any(keyword in col_lower for keyword in keywords):
+                synonym_mappings[col] = synonyms
+                break
         
         # Generate example queries based on column type and content
         example_queries = []
@@ -169,7 +305,7 @@ def get_column_metadata(df: pd.DataFrame, file_id):
 
 def clean_column_name(col_name: str, used_names: set) -> str:
     """Clean and ensure unique column names for PostgreSQL"""
-    clean_col = re.sub(r'[^a-zA-Z0-9_]', '_', str(col_name)).lower()
+    clean_col = NON_IDENTIFIER_RE.sub('_', str(col_name)).lower()
     
     # Handle names starting with digits
     if clean_col and clean_col[0].isdigit():
@@ -195,34 +331,54 @@ def clean_column_name(col_name: str, used_names: set) -> str:
     return clean_col
 
 
-def clean_table_name(table_name: str) -> str:
-    """Clean table name for PostgreSQL compatibility"""
+@functools.lru_cache(maxsize=1024)
+def sanitize_table_name(table_name: str) -> str:
+    """Deterministic part of clean_table_name (may return an empty string)"""
     # Remove file extensions and special characters
-    clean_name = re.sub(r'\.(csv|xlsx?|json|txt)$', '', table_name, flags=re.IGNORECASE)
+    clean_name = FILE_EXTENSION_RE.sub('', table_name)
     # Replace all non-alphanumeric characters with underscores
-    clean_name = re.sub(r'[^a-zA-Z0-9_]', '_', clean_name).lower()
-    
+    clean_name = NON_IDENTIFIER_RE.sub('_', clean_name).lower()
+
     # Handle names starting with digits
     if clean_name and clean_name[0].isdigit():
         clean_name = f"table_{clean_name}"
-    
-    # Handle empty names
-    if not clean_name:
-        clean_name = f"table_{str(uuid4()).replace('-', '_')}"
-    
+
     # Truncate if too long (PostgreSQL limit is 63 characters)
     if len(clean_name) > 60:  # Leave room for potential suffixes
         clean_name = clean_name[:60]
-    
+
+    return clean_name
+
+
+def clean_table_name(table_name: str) -> str:
+    """Clean table name for PostgreSQL compatibility"""
+    clean_name = sanitize_table_name(table_name)
+
+    # Handle empty names (outside the cache so each one gets a fresh name)
+    if not clean_name:
+        clean_name = f"table_{str(uuid4()).replace('-', '_')}"
+
     return clean_name
 
 
-def create_table_sql(sql: str, table_name: str, conn: sqlalchemy.Engine):
-    """Execute the CREATE TABLE SQL statement"""
-    with conn.connect() as connection:
-        with connection.begin():
-            connection.execute(text(f'DROP TABLE IF EXISTS "{table_name}" CASCADE'))
-            connection.execute(text(sql))
+def create_table_sql(sql: str, table_name: str, conn: sqlalchemy.Connection):
+    """Execute the CREATE TABLE SQL statement on the caller's connection/transaction"""
+    validate_table_name(table_name)
+    conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}" CASCADE'))
+    conn.execute(text(sql))
+
+def max_text_length(data: pd.Series) -> int:
+    """Longest string length in a text column, measured on Arrow's contiguous string buffer"""
+    try:
+        array = pa.array(data, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        array = None
+
+    if array is None or not pa.types.is_string(array.type):
+        # Mixed-type object columns: measure their string form
+        return int(data.astype(str).str.len().max())
+    return pc.max(pc.utf8_length(array)).as_py()
+
 
 def generate_table_schema(df: pd.DataFrame, table_name=None):
     """
@@ -247,8 +403,9 @@ def generate_table_schema(df: pd.DataFrame, table_name=None):
         
         data = df[col]
         
-        # Determine best SQL type with smart analysis
-        if pd.api.types.is_integer_dtype(data.dtype):
+        # Determine best SQL type with smart analysis, dispatching on the dtype kind code
+        kind = data.dtype.kind
+        if kind in 'iu':
             # Check actual range for optimal integer type
             min_val, max_val = data.min(), data.max()
             if -32768 <= min_val and max_val <= 32767:
@@ -257,21 +414,15 @@ def generate_table_schema(df: pd.DataFrame, table_name=None):
                 sql_type = "INTEGER"
             else:
                 sql_type = "BIGINT"
-                
-        elif pd.api.types.is_float_dtype(data.dtype):
-            sql_type = "DOUBLE PRECISION"
-                
-        elif pd.api.types.is_bool_dtype(data.dtype):
-            sql_type = "BOOLEAN"
-            
-        elif pd.api.types.is_datetime64_any_dtype(data.dtype):
-            sql_type = "TIMESTAMP"
-            
+
+        elif kind in FIXED_SQL_TYPES:
+            sql_type = FIXED_SQL_TYPES[kind]
+
         else:  # Text/object columns
             if data.dropna().empty:
                 varchar_len = 255
             else:
-                max_len = data.astype(str).str.len().max()
+                max_len = max_text_length(data)
                 # Optimized VARCHAR sizing for performance
                 if max_len <= 5:
                     varchar_len = 20    # Very short codes
@@ -302,27 +453,51 @@ def generate_table_schema(df: pd.DataFrame, table_name=None):
 
 
 def save_table_metadata(metadata_list: list[ColumnMetadata], db: Session):
-    db.add_all(metadata_list)
+    """Persist column metadata with one bulk INSERT instead of flushing each object"""
+    # IDs are generated client-side, so the objects stay usable (and unexpired) without RETURNING
+    rows = [
+        {key: value for key, value in vars(metadata).items() if not key.startswith('_')}
+        for metadata in metadata_list
+    ]
+    if rows:
+        db.execute(insert(ColumnMetadata), rows)
     db.commit()
 
-def insert_values(df: pd.DataFrame, table_name: str, conn: sqlalchemy.Engine):
-    """Insert DataFrame values safely and efficiently using pandas to_sql"""
+def insert_values(df: pd.DataFrame, table_name: str, conn: sqlalchemy.Connection):
+    """Insert DataFrame values with PostgreSQL COPY on the caller's connection/transaction"""
+    validate_table_name(table_name)
+
     # Clean column names to match the table schema
-    df_clean = df.copy()
     used_names = set()
-    column_mapping = {}
-    
-    for col in df.columns:
-        clean_col = clean_column_name(col, used_names)
-        column_mapping[col] = clean_col
-    
-    df_clean.rename(columns=column_mapping, inplace=True)
-    
-    df_clean.to_sql(
-        name=table_name,
-        con=conn,
-        if_exists='append',
-        index=False,
-        method='multi',
-        chunksize=1000
-    )
+    clean_columns = [clean_column_name(col, used_names) for col in df.columns]
+
+    # Convert to Arrow once so the COPY payload is serialized from columnar buffers
+    # instead of iterating Python objects row by row
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False).rename_columns(clean_columns)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Mixed-type object columns: fall back to the row-wise COPY writer
+        table = None
+
+    if table is None:
+        # Rename and append one slice at a time so only a single chunk is ever copied
+        for start in range(0, len(df), INSERT_CHUNK_ROWS):
+            chunk = df.iloc[start:start + INSERT_CHUNK_ROWS].set_axis(clean_columns, axis=1)
+            chunk.to_sql(
+                name=table_name,
+                con=conn,
+                if_exists='append',
+                index=False,
+                method=psql_insert_copy
+            )
+        return
+
+    columns = ", ".join(f'"{col}"' for col in clean_columns)
+    write_options = pacsv.WriteOptions(include_header=False)
+
+    with conn.connection.cursor() as cursor:
+        for batch in table.to_batches(max_chunksize=INSERT_CHUNK_ROWS):
+            buffer = io.BytesIO()
+            pacsv.write_csv(batch, buffer, write_options)
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY "{table_name}" ({columns}) FROM STDIN WITH CSV', buffer)
@@ -0,0 +1,37 @@
+"""
+Identifier validation and database helpers shared by the API, services and database layers.
+"""
+
+import csv
+import io
+import re
+
+# Canonical hyphenated UUID, used to validate IDs without building UUID objects
+UUID_RE = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+# Identifiers we are willing to interpolate into DDL/DML (output of clean_table_name)
+TABLE_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def validate_table_name(table_name: str) -> str:
+    """Reject table names that are not plain identifiers before they are quoted into SQL"""
+    if not TABLE_NAME_RE.fullmatch(table_name):
+        raise ValueError(f"Invalid table name: {table_name!r}")
+    return table_name
+
+
+def psql_insert_copy(table, conn, keys, data_iter):
+    """
+    pandas to_sql insertion method that bulk-loads rows with PostgreSQL COPY.
+    Rows are written to an in-memory CSV buffer and streamed in one COPY statement
+    instead of being bound as INSERT parameters.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(data_iter)
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{key}"' for key in keys)
+    table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH CSV", buffer)
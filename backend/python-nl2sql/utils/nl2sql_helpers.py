@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from services.two_model_pipeline import get_two_model_pipeline
 from services.memory_service import get_memory_service
+from utils.db_utils import UUID_RE
 import json
 
 logger = logging.getLogger(__name__)
@@ -47,14 +48,14 @@ async def generate_sql(question: str, user_id: str, chat_id: str, dataset_contex
         result = await pipeline.generate_sql(user_id, chat_id, question, dataset_context)
         
         if result["success"]:
-            logger.info(f"Generated SQL for user {user_id}: {result['sql_query'][:100]}...")
+            logger.info("Generated SQL for user %s: %.100s...", user_id, result['sql_query'])
         else:
-            logger.error(f"SQL generation failed: {result.get('error')}")
+            logger.error("SQL generation failed: %s", result.get('error'))
             
         return result
         
     except Exception as e:
-        logger.error(f"Error in generate_sql: {e}")
+        logger.error("Error in generate_sql: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -78,14 +79,14 @@ async def execute_sql(sql: str, user_id: str, db: Session) -> Dict[str, Any]:
         result = await pipeline.execute_sql(sql, user_id, db)
         
         if result["success"]:
-            logger.info(f"Executed SQL for user {user_id}: {result['row_count']} rows returned")
+            logger.info("Executed SQL for user %s: %s rows returned", user_id, result['row_count'])
         else:
-            logger.error(f"SQL execution failed: {result.get('error')}")
+            logger.error("SQL execution failed: %s", result.get('error'))
             
         return result
         
     except Exception as e:
-        logger.error(f"Error in execute_sql: {e}")
+        logger.error("Error in execute_sql: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -110,14 +111,14 @@ async def generate_answer(question: str, sql_query: str, sql_result: Dict[str, A
         result = await pipeline.generate_answer(question, sql_query, sql_result, dataset_context)
         
         if result["success"]:
-            logger.info(f"Generated answer with {len(result['answer'])} characters")
+            logger.info("Generated answer with %d characters", len(result['answer']))
         else:
-            logger.error(f"Answer generation failed: {result.get('error')}")
+            logger.error("Answer generation failed: %s", result.get('error'))
             
         return result
         
     except Exception as e:
-        logger.error(f"Error in generate_answer: {e}")
+        logger.error("Error in generate_answer: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -165,11 +166,7 @@ def validate_user_input(question: str, user_id: str, chat_id: str) -> Dict[str,
                 }
         
         # Validate UUIDs
-        import uuid
-        try:
-            uuid.UUID(user_id)
-            uuid.UUID(chat_id)
-        except ValueError:
+        if not (UUID_RE.fullmatch(user_id) and UUID_RE.fullmatch(chat_id)):
             return {
                 "valid": False,
                 "error": "Invalid user ID or chat ID format"
@@ -181,7 +178,7 @@ def validate_user_input(question: str, user_id: str, chat_id: str) -> Dict[str,
         }
         
     except Exception as e:
-        logger.error(f"Error validating user input: {e}")
+        logger.error("Error validating user input: %s", e)
         return {
             "valid": False,
             "error": "Input validation failed"
@@ -241,7 +238,7 @@ def format_sql_result_for_display(sql_result: Dict[str, Any], max_rows: int = 10
         return formatted_result
         
     except Exception as e:
-        logger.error(f"Error formatting SQL result: {e}")
+        logger.error("Error formatting SQL result: %s", e)
         return {
             "success": False,
             "error": str(e),
@@ -280,7 +277,7 @@ def get_conversation_context(user_id: str, chat_id: str, limit: int = 5) -> List
         return relevant_messages[-limit:]  # Return last N relevant messages
         
     except Exception as e:
-        logger.error(f"Error getting conversation context: {e}")
+        logger.error("Error getting conversation context: %s", e)
         return []
 
 def handle_sql_error(error: str, sql_query: str) -> Dict[str, Any]:
@@ -339,7 +336,7 @@ def handle_sql_error(error: str, sql_query: str) -> Dict[str, Any]:
             }
             
     except Exception as e:
-        logger.error(f"Error handling SQL error: {e}")
+        logger.error("Error handling SQL error: %s", e)
         return {
             "category": "error_handler_failed",
             "user_message": "I encountered an unexpected error. Please try again.",
@@ -390,5 +387,5 @@ def create_fallback_response(question: str, error_info: Dict[str, Any]) -> str:
         return base_response
         
     except Exception as e:
-        logger.error(f"Error creating fallback response: {e}")
+        logger.error("Error creating fallback response: %s", e)
         return "I'm having trouble processing your question right now. Please try again later."
\ No newline at end of file